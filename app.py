@@ -1,61 +1,79 @@
 import streamlit as st
 import pandas as pd
-import importlib.util
-import subprocess
-import sys
-import os
-from io import StringIO
-
-
-def install_library(library_name):
-    try:
-
-        if importlib.util.find_spec(library_name) is None:
-            st.warning(f"Библиотека {library_name} не найдена. Устанавливаем...")
-            subprocess.check_call([sys.executable, "-m", "pip", "install", library_name])
-            st.success(f"Библиотека {library_name} успешно установлена!")
-        else:
-            pass 
-    except Exception as e:
-        st.error(f"Ошибка при установке {library_name}: {str(e)}")
-        st.stop()
-
-
-required_libraries = ["plotly", "pandas", "streamlit"]
-
-
-for lib in required_libraries:
-    install_library(lib)
-
-
+import numpy as np
+from pandas.api.types import union_categoricals
+from io import BytesIO
 import plotly.express as px
 import plotly.graph_objects as go
 
+from data_io import load_data
+
 st.set_page_config(page_title="IMDB 5000 Movie Analytics", layout="wide")
 
+# Начиная с этого числа точек скаттер рисуется через WebGL, а не SVG
+SCATTERGL_MIN_ROWS = 1000
+# Выше этого числа точек вместо скаттера строится 2D-гистограмма (тепловая карта)
+SCATTER_HEATMAP_MIN_ROWS = 10_000
+# Сколько разных наборов фильтров держать в кэшах отфильтрованных данных
+FILTER_CACHE_MAX_ENTRIES = 32
+
+# Префикс _ исключает DataFrame из ключа кэша: иначе Streamlit хэширует его на каждом перезапуске;
+# вместо него ключом служит data_version
 @st.cache_data
-def load_data():
-    try:
-        file_path = 'data/movie_metadata.csv'
-        if not os.path.exists(file_path):
-            st.error(f"Файл {file_path} не найден!")
-            return pd.DataFrame()
-        df = pd.read_csv(file_path)
-
-        df['genres'] = df['genres'].fillna('Unknown')
-        df['actor_1_name'] = df['actor_1_name'].fillna('Unknown')
-        df['actor_2_name'] = df['actor_2_name'].fillna('Unknown')
-        df['actor_3_name'] = df['actor_3_name'].fillna('Unknown')
-        df['title_year'] = df['title_year'].fillna(0).astype(int)
-        df['budget'] = df['budget'].fillna(0)
-        df['gross'] = df['gross'].fillna(0)
-        df['imdb_score'] = df['imdb_score'].fillna(0)
-        return df
-    except Exception as e:
-        st.error(f"Ошибка загрузки: {str(e)}")
-        return pd.DataFrame()
+def get_filter_universe(data_version, _df):
+    genres_list = sorted(
+        genre for genre in
+        _df['genres'].str.split('|', expand=False).explode().dropna().str.strip().unique()
+        if genre
+    )
+    actors_list = (
+        _df['actor_1_name'].cat.categories
+        .union(_df['actor_2_name'].cat.categories)
+        .union(_df['actor_3_name'].cat.categories)
+        .tolist()
+    )
+
+    min_year = 1900
+    max_year = 2020
+    if 'title_year' in _df.columns:
+        years = _df.loc[_df['title_year'] > 0, 'title_year']
+        min_year = int(years.min())
+        max_year = int(years.max())
+    return genres_list, actors_list, min_year, max_year
+
+# df берется из модуля, а не из аргументов, чтобы кэш не хэшировал весь DataFrame;
+# data_version (mtime CSV) в ключе сбрасывает кэш при обновлении данных
+@st.cache_data(max_entries=FILTER_CACHE_MAX_ENTRIES)
+def apply_filters(data_version, year_range, selected_genres, selected_actors, search_query):
+    mask = df['title_year'].between(year_range[0], year_range[1]).to_numpy(copy=True)
+    
+    if 'All' not in selected_genres:
+        selected_set = frozenset(selected_genres)
+        mask &= df['_genre_sets'].map(selected_set.isdisjoint).eq(False).to_numpy()
+    
+    if 'All' not in selected_actors:
+        mask &= df['_actors'].map(frozenset(selected_actors).isdisjoint).eq(False).to_numpy()
+    
+    if search_query:
+        query = search_query.lower()
+        mask &= df['_title_lower'].str.contains(query, regex=False).to_numpy()
+
+    return df.loc[mask]
+
+# Кэш привязан к версии данных и набору фильтров; сам отфильтрованный DataFrame (с префиксом _) не хэшируется
+@st.cache_data(max_entries=FILTER_CACHE_MAX_ENTRIES)
+def get_filtered_csv(data_version, filters, _filtered_data):
+    buf = BytesIO()
+    _filtered_data.drop(columns=[c for c in _filtered_data.columns if c.startswith('_')]).to_csv(buf, index=False)
+    return buf.getvalue()
+
+@st.cache_data(max_entries=FILTER_CACHE_MAX_ENTRIES)
+def get_genre_long(data_version, filters, _filtered_data):
+    return _filtered_data[['gross']].join(
+        _filtered_data['genres'].str.split('|').explode().rename('genre').str.strip()
+    )
 
-df = load_data()
+df, data_version = load_data()
 
 if not isinstance(df, pd.DataFrame) or df.empty:
     st.error("Критическая ошибка: Не удалось инициализировать DataFrame")
@@ -71,33 +89,33 @@ st.markdown("""
 with st.sidebar:
     st.header("Фильтры")
     
-    min_year = 1900
-    max_year = 2020
-    if 'title_year' in df.columns:
-        min_year = int(df[df['title_year'] > 0]['title_year'].min())
-        max_year = int(df[df['title_year'] > 0]['title_year'].max())
-
-    year_range = st.slider(
-        "Год выпуска",
-        min_year, max_year,
-        (min_year, max_year)
-    )
-    
-    genres = ['All'] + sorted(set([genre.strip() for genres in df['genres'].str.split('|') for genre in genres if genre]))
-    selected_genres = st.multiselect(
-        "Жанры",
-        options=genres,
-        default=['All']
-    )
-    
-    actors = ['All'] + sorted(set(df['actor_1_name'].tolist() + df['actor_2_name'].tolist() + df['actor_3_name'].tolist()))
-    selected_actors = st.multiselect(
-        "Актеры",
-        options=actors,
-        default=['All']
-    )
-    
-    search_query = st.text_input("Поиск по названию фильма")
+    genres_list, actors_list, min_year, max_year = get_filter_universe(data_version, df)
+
+    # Фильтры собраны в форму: перезапуск происходит только по кнопке, а не на каждое изменение
+    with st.form('filters'):
+        year_range = st.slider(
+            "Год выпуска",
+            min_year, max_year,
+            (min_year, max_year)
+        )
+
+        genres = ['All'] + genres_list
+        selected_genres = st.multiselect(
+            "Жанры",
+            options=genres,
+            default=['All']
+        )
+
+        actors = ['All'] + actors_list
+        selected_actors = st.multiselect(
+            "Актеры",
+            options=actors,
+            default=['All']
+        )
+
+        search_query = st.text_input("Поиск по названию фильма")
+        submitted = st.form_submit_button("Применить")
+
     show_stats = st.checkbox("Показать статистику")
     
 
@@ -112,55 +130,45 @@ with st.sidebar:
         ["Короткий ($100M)", "Длинный ($100000000)"]
     )
 
+if submitted or 'filters_state' not in st.session_state:
+    st.session_state['filters_state'] = (tuple(year_range), tuple(selected_genres), tuple(selected_actors), search_query)
+filters = st.session_state['filters_state']
+year_range, selected_genres, selected_actors, search_query = filters
+
 try:
-    filtered_data = df.copy()
-    
-    filtered_data = filtered_data[filtered_data['title_year'].between(year_range[0], year_range[1])]
-    
-    if 'All' not in selected_genres:
-        filtered_data = filtered_data[
-            filtered_data['genres'].str.contains('|'.join(selected_genres), case=False, na=False)
-        ]
-    
-    if 'All' not in selected_actors:
-        filtered_data = filtered_data[
-            (filtered_data['actor_1_name'].isin(selected_actors)) |
-            (filtered_data['actor_2_name'].isin(selected_actors)) |
-            (filtered_data['actor_3_name'].isin(selected_actors))
-        ]
-    
-    if search_query:
-        filtered_data = filtered_data[
-            filtered_data['movie_title'].str.contains(search_query, case=False, na=False)
-        ]
+    filtered_data = apply_filters(data_version, year_range, selected_genres, selected_actors, search_query)
 
 except Exception as e:
     st.error(f"Ошибка фильтрации: {str(e)}")
-    filtered_data = df.copy()
+    filtered_data = df
+
+budget_values = filtered_data['budget'].to_numpy(dtype=np.float32)
+gross_values = filtered_data['gross'].to_numpy(dtype=np.float32)
+score_values = filtered_data['imdb_score'].to_numpy()
+
+n_movies = score_values.size
+avg_score = score_values.mean() if n_movies else np.nan
+roi_mask = (budget_values >= 1000) & (gross_values > 0)
+roi_budget = budget_values[roi_mask]
+roi = float(np.median((gross_values[roi_mask] - roi_budget) / roi_budget)) * 100 if roi_mask.any() else np.nan
 
 col1, col2, col3 = st.columns(3)
 with col1:
-    st.metric("Всего фильмов", len(filtered_data))
+    st.metric("Всего фильмов", n_movies)
 
 with col2:
-    avg_score = filtered_data['imdb_score'].mean()
     st.metric("Средний рейтинг IMDB", f"{avg_score:.1f}" if pd.notna(avg_score) else "Нет данных")
 
 with col3:
-    try:
-        roi_data = filtered_data[(filtered_data['budget'] >= 1000) & (filtered_data['gross'] > 0)]
-        if not roi_data.empty:
-            roi = ((roi_data['gross'] - roi_data['budget']) / roi_data['budget']).median() * 100
-            st.metric("Медианный ROI", f"{roi:.1f}%" if pd.notna(roi) else "Нет данных")
-        else:
-            st.metric("Медианный ROI", "Нет данных")
-    except Exception:
-        st.metric("Медианный ROI", "Нет данных")
+    st.metric("Медианный ROI", f"{roi:.1f}%" if pd.notna(roi) else "Нет данных")
 
 if show_stats and not filtered_data.empty:
     st.subheader("Дополнительная статистика")
-    st.write(f"**Самый популярный жанр:** {pd.Series([genre for genres in filtered_data['genres'].str.split('|') for genre in genres]).value_counts().index[0]}")
-    st.write(f"**Самый частый актер:** {pd.concat([filtered_data['actor_1_name'], filtered_data['actor_2_name'], filtered_data['actor_3_name']]).value_counts().index[0]}")
+    top_genre = get_genre_long(data_version, filters, filtered_data)['genre'].mode().iat[0]
+    all_actors = union_categoricals([filtered_data['actor_1_name'], filtered_data['actor_2_name'], filtered_data['actor_3_name']])
+    top_actor = all_actors.categories[np.bincount(all_actors.codes, minlength=len(all_actors.categories)).argmax()]
+    st.write(f"**Самый популярный жанр:** {top_genre}")
+    st.write(f"**Самый частый актер:** {top_actor}")
     st.write(f"**Средний бюджет:** ${filtered_data['budget'].mean():,.0f}")
     st.write(f"**Средние сборы:** ${filtered_data['gross'].mean():,.0f}")
 
@@ -188,20 +196,46 @@ if not filtered_data.empty:
         )
 
         if plot_type == "Бюджет vs Сборы (Скаттер)":
-            fig = px.scatter(
-                filtered_data,
-                x='budget',
-                y='gross',
-                color='imdb_score',
-                size='imdb_score',
-                hover_data=['movie_title', 'budget', 'gross', 'imdb_score'],
-                log_x=True,
-                log_y=True,
-                title="Бюджет vs Сборы (цвет и размер — рейтинг IMDB)",
-                labels={'budget': 'Бюджет ($)', 'gross': 'Сборы ($)', 'imdb_score': 'IMDB Score'},
-                color_continuous_scale='Viridis',
-                template='plotly_dark'
-            )
+            if len(filtered_data) > SCATTER_HEATMAP_MIN_ROWS:
+                positive = (budget_values > 0) & (gross_values > 0)
+                counts, x_edges, y_edges = np.histogram2d(
+                    np.log10(budget_values[positive]),
+                    np.log10(gross_values[positive]),
+                    bins=200
+                )
+                fig = go.Figure(
+                    go.Heatmap(
+                        x=10 ** ((x_edges[:-1] + x_edges[1:]) / 2),
+                        y=10 ** ((y_edges[:-1] + y_edges[1:]) / 2),
+                        z=np.where(counts.T > 0, counts.T, np.nan),
+                        colorscale='Viridis',
+                        colorbar=dict(title='Фильмов')
+                    )
+                )
+                fig.update_layout(
+                    title="Бюджет vs Сборы (плотность фильмов)",
+                    xaxis_title="Бюджет ($)",
+                    yaxis_title="Сборы ($)",
+                    xaxis_type='log',
+                    yaxis_type='log',
+                    template='plotly_dark'
+                )
+            else:
+                fig = px.scatter(
+                    filtered_data,
+                    x='budget',
+                    y='gross',
+                    color='imdb_score',
+                    size='imdb_score',
+                    hover_data=['movie_title', 'budget', 'gross', 'imdb_score'],
+                    log_x=True,
+                    log_y=True,
+                    title="Бюджет vs Сборы (цвет и размер — рейтинг IMDB)",
+                    labels={'budget': 'Бюджет ($)', 'gross': 'Сборы ($)', 'imdb_score': 'IMDB Score'},
+                    color_continuous_scale='Viridis',
+                    template='plotly_dark',
+                    render_mode='webgl' if len(filtered_data) >= SCATTERGL_MIN_ROWS else 'svg'
+                )
             if number_format == "Короткий ($100M)":
                 fig.update_layout(
                     xaxis=dict(tickvals=tickvals_budget, ticktext=ticktext_budget, **axis_style),
@@ -220,20 +254,18 @@ if not filtered_data.empty:
                 )
 
         elif plot_type == "Сборы по жанрам (Box)":
-            genre_data = filtered_data[['gross', 'genres']].copy()
-            genre_data['genres'] = genre_data['genres'].str.split('|')
-            genre_data = genre_data.explode('genres')
-            top_genres = genre_data['genres'].value_counts().head(10).index
-            genre_data = genre_data[genre_data['genres'].isin(top_genres)]
+            genre_long = get_genre_long(data_version, filters, filtered_data)
+            top_genres = genre_long['genre'].value_counts(sort=True).head(10).index
+            genre_data = genre_long[genre_long['genre'].isin(top_genres)]
             
             fig = px.box(
                 genre_data,
-                x='genres',
+                x='genre',
                 y='gross',
                 title="Распределение сборов по жанрам (Топ-10)",
-                labels={'genres': 'Жанр', 'gross': 'Сборы ($)'},
+                labels={'genre': 'Жанр', 'gross': 'Сборы ($)'},
                 template='plotly_dark',
-                color='genres',
+                color='genre',
                 color_discrete_sequence=px.colors.qualitative.Set2
             )
             if number_format == "Короткий ($100M)":
@@ -253,22 +285,29 @@ if not filtered_data.empty:
                 )
 
         elif plot_type == "Тренды по годам (Линейный)":
-            yearly_data = filtered_data.groupby('title_year')[['budget', 'gross']].mean().reset_index()
-            yearly_data = yearly_data[yearly_data['title_year'] > 0]
+            year_mask = filtered_data['title_year'].to_numpy() > 0
+            yearly_data = (
+                filtered_data.loc[year_mask, ['title_year', 'budget', 'gross']]
+                .groupby('title_year', sort=True, as_index=False)
+                .agg({'budget': 'mean', 'gross': 'mean'})
+            )
+            years = np.ascontiguousarray(yearly_data['title_year'].to_numpy())
+            yearly_budget = np.ascontiguousarray(yearly_data['budget'].to_numpy())
+            yearly_gross = np.ascontiguousarray(yearly_data['gross'].to_numpy())
             
             fig = go.Figure()
             fig.add_trace(
                 go.Scatter(
-                    x=yearly_data['title_year'],
-                    y=yearly_data['budget'],
+                    x=years,
+                    y=yearly_budget,
                     name='Средний бюджет',
                     line=dict(color='blue')
                 )
             )
             fig.add_trace(
                 go.Scatter(
-                    x=yearly_data['title_year'],
-                    y=yearly_data['gross'],
+                    x=years,
+                    y=yearly_gross,
                     name='Средние сборы',
                     line=dict(color='orange')
                 )
@@ -297,16 +336,20 @@ if not filtered_data.empty:
                 )
 
         elif plot_type == "Распределение рейтингов (Гистограмма)":
-            fig = px.histogram(
-                filtered_data,
-                x='imdb_score',
-                nbins=20,
-                title="Распределение рейтингов IMDB",
-                labels={'imdb_score': 'Рейтинг IMDB', 'count': 'Количество фильмов'},
-                template='plotly_dark',
-                color_discrete_sequence=['teal']
+            counts, edges = np.histogram(score_values, bins=20, range=(0, 10))
+            fig = go.Figure(
+                go.Bar(
+                    x=(edges[:-1] + edges[1:]) / 2,
+                    y=counts,
+                    width=edges[1] - edges[0],
+                    marker_color='teal'
+                )
             )
             fig.update_layout(
+                title="Распределение рейтингов IMDB",
+                xaxis_title="Рейтинг IMDB",
+                yaxis_title="Количество фильмов",
+                template='plotly_dark',
                 xaxis=dict(tickformat='d', **axis_style),
                 yaxis=dict(tickformat='d', **axis_style),
                 showlegend=False,
@@ -324,7 +367,7 @@ if not filtered_data.empty:
     st.write(f"Найдено {len(filtered_data)} фильмов")
     st.dataframe(filtered_data[['movie_title', 'genres', 'actor_1_name', 'actor_2_name', 'actor_3_name', 'imdb_score', 'budget', 'gross']])
     
-    csv = filtered_data.to_csv(index=False)
+    csv = get_filtered_csv(data_version, filters, filtered_data)
     st.download_button(
         label="Скачать отфильтрованные данные (CSV)",
         data=csv,
@@ -0,0 +1,81 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import os
+import tempfile
+
+FILE_PATH = 'data/movie_metadata.csv'
+PARQUET_PATH = 'data/movie_metadata.parquet'
+
+# Кэшируются только успешные загрузки: исключения не попадают в кэш, в том числе на диске.
+# csv_mtime входит в ключ кэша, чтобы обновленный CSV не подменялся старой копией с диска
+@st.cache_data(persist="disk")
+def read_movie_metadata(file_path, parquet_path, csv_mtime):
+    # Parquet-копия уже очищенных данных ускоряет холодный старт; пересобирается, если CSV новее
+    df = None
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= csv_mtime:
+        try:
+            df = pd.read_parquet(parquet_path)
+            # Parquet отдает строки не как ArrowDtype: приводим к тем же типам, что дает CSV-путь
+            arrow_string = pd.ArrowDtype(pa.string())
+            for col in df.columns:
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].cat.set_categories(df[col].cat.categories.astype(arrow_string))
+                elif pd.api.types.is_string_dtype(df[col].dtype):
+                    df[col] = df[col].astype(arrow_string)
+        except Exception as e:
+            df = None
+            st.warning(f"Кэш {parquet_path} поврежден, данные перечитываются из CSV: {str(e)}")
+
+    if df is None:
+        df = pd.read_csv(
+            file_path,
+            engine='pyarrow',
+            dtype_backend='pyarrow',
+            dtype={'title_year': 'Int16', 'imdb_score': 'Float32', 'budget': 'Int64', 'gross': 'Int64'}
+        )
+
+        df['genres'] = df['genres'].fillna('Unknown')
+        df['actor_1_name'] = df['actor_1_name'].fillna('Unknown')
+        df['actor_2_name'] = df['actor_2_name'].fillna('Unknown')
+        df['actor_3_name'] = df['actor_3_name'].fillna('Unknown')
+        df['title_year'] = df['title_year'].fillna(0).astype('int16')
+        df['budget'] = df['budget'].fillna(0).astype('int64')
+        df['gross'] = df['gross'].fillna(0).astype('int64')
+        df['imdb_score'] = df['imdb_score'].fillna(0).astype('float32')
+
+        for col in ['genres', 'actor_1_name', 'actor_2_name', 'actor_3_name']:
+            df[col] = df[col].astype('category')
+
+        # Пишем во временный файл рядом и атомарно подменяем, чтобы не оставить недописанный Parquet
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(parquet_path),
+                prefix='movie_metadata.',
+                suffix='.parquet.tmp'
+            )
+            os.close(fd)
+            df.to_parquet(tmp_path, compression='zstd')
+            os.replace(tmp_path, parquet_path)
+        except Exception as e:
+            st.warning(f"Не удалось сохранить кэш {parquet_path}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    df['_genre_sets'] = df['genres'].str.split('|').map(frozenset)
+    df['_actors'] = list(map(frozenset, zip(df['actor_1_name'], df['actor_2_name'], df['actor_3_name'])))
+    df['_title_lower'] = df['movie_title'].str.lower().fillna('')
+    return df
+
+# Возвращает данные и их версию (mtime CSV): версия передается в кэши производных результатов
+def load_data():
+    try:
+        if not os.path.exists(FILE_PATH):
+            st.error(f"Файл {FILE_PATH} не найден!")
+            return pd.DataFrame(), None
+        data_version = os.path.getmtime(FILE_PATH)
+        return read_movie_metadata(FILE_PATH, PARQUET_PATH, data_version), data_version
+    except Exception as e:
+        st.error(f"Ошибка загрузки: {str(e)}")
+        return pd.DataFrame(), None